@@ -105,6 +105,10 @@ class AL_Node(Node):
         self._cached_depth = depth
         return depth
 
+    def is_root(self):
+        """:returns: True if the node is a root node (else, returns False)"""
+        return self.parent_id is None
+
     def get_children(self):
         """:returns: A queryset of all the node's children"""
         return get_result_class(self.__class__).objects.filter(parent=self)
@@ -123,6 +127,16 @@ class AL_Node(Node):
         else:
             return self.parent
 
+    @classmethod
+    def _prefetch_parents(cls, nodes):
+        """
+        Caches the parents of many nodes, fetching all of them with a single
+        query.
+        """
+        if not cls._meta.proxy_for_model:
+            # proxy nodes always fetch their parents as proxy instances
+            models.prefetch_related_objects(list(nodes), 'parent')
+
     def get_ancestors(self):
         """
         :returns: A *list* containing the current node object's ancestors,
@@ -158,7 +172,30 @@ class AL_Node(Node):
         :returns: ``True`` if the node if a descendant of another node given
             as an argument, else, returns ``False``
         """
-        return self.pk in [obj.pk for obj in node.get_descendants()]
+        # walking up from the node is a query per level, while walking down
+        # the branch of the other node is a query per descendant
+        qset = get_result_class(self.__class__).objects
+        parent_id = self.parent_id
+        while parent_id is not None:
+            if parent_id == node.pk:
+                return True
+            parent_id = qset.filter(pk=parent_id).values_list(
+                'parent_id', flat=True).first()
+        return False
+
+    def is_sibling_of(self, node):
+        """
+        :returns: ``True`` if the node is a sibling of another node given as an
+            argument, else, returns ``False``
+        """
+        return self.parent_id == node.parent_id
+
+    def is_child_of(self, node):
+        """
+        :returns: ``True`` if the node is a child of another node given as an
+            argument, else, returns ``False``
+        """
+        return self.parent_id is not None and self.parent_id == node.pk
 
     @classmethod
     def dump_bulk(cls, parent=None, keep_ids=True):
@@ -269,6 +306,42 @@ class AL_Node(Node):
         """:returns: the number of descendants of a nodee"""
         return len(self.get_descendants())
 
+    @classmethod
+    def get_descendants_group_count(cls, parent=None):
+        """
+        Helper for a very common case: get a group of siblings and the number
+        of *descendants* in every sibling.
+        """
+        if parent is None:
+            qset = cls.get_root_nodes()
+        else:
+            qset = parent.get_children()
+        nodes = list(qset)
+
+        # the descendants are counted a whole level at a time, mapping every
+        # node of the level to the sibling it descends from, instead of
+        # walking the branch of every sibling one node at a time
+        result_class = get_result_class(cls)
+        db_connection = cls._get_database_connection('read')
+        level = {}
+        for node in nodes:
+            node.descendants_count = 0
+            level[node.pk] = node
+        while level:
+            parent_ids = list(level)
+            batch_size = db_connection.ops.bulk_batch_size(
+                ['parent'], parent_ids)
+            nextlevel = {}
+            for start in range(0, len(parent_ids), batch_size):
+                for pk, parent_id in result_class.objects.filter(
+                        parent_id__in=parent_ids[start:start + batch_size]
+                ).values_list('pk', 'parent_id'):
+                    node = level[parent_id]
+                    node.descendants_count += 1
+                    nextlevel[pk] = node
+            level = nextlevel
+        return nodes
+
     def get_siblings(self):
         """
         :returns: A queryset of all the node's siblings, including the node
@@ -279,6 +352,26 @@ class AL_Node(Node):
                 parent=self.parent)
         return self.__class__.get_root_nodes()
 
+    def get_next_sibling(self):
+        """
+        :returns: The next node's sibling, or None if it was the rightmost
+            sibling.
+        """
+        if self.node_order_by:
+            return super().get_next_sibling()
+        return get_result_class(self.__class__).objects.filter(
+            parent_id=self.parent_id, sib_order__gt=self.sib_order).first()
+
+    def get_prev_sibling(self):
+        """
+        :returns: The previous node's sibling, or None if it was the leftmost
+            sibling.
+        """
+        if self.node_order_by:
+            return super().get_prev_sibling()
+        return get_result_class(self.__class__).objects.filter(
+            parent_id=self.parent_id, sib_order__lt=self.sib_order).last()
+
     def add_sibling(self, pos=None, **kwargs):
         """Adds a new node as a sibling to the current node object."""
         pos = self._prepare_pos_var_for_add_sibling(pos)
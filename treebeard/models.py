@@ -1,10 +1,7 @@
 """Models and base API"""
 
-import operator
-from functools import reduce
-
 from django.db.models import Q
-from django.db import models, router, connections
+from django.db import models, router, connections, transaction
 
 from treebeard.exceptions import InvalidPosition, MissingNodeOrderBy
 
@@ -98,29 +95,39 @@ class Node(models.Model):
         # tree, iterative preorder
         added = []
         # stack of nodes to analyze
-        stack = [(parent, node) for node in bulk_data[::-1]]
+        stack = [(parent, node) for node in reversed(bulk_data)]
         foreign_keys = cls.get_foreign_keys()
         pk_field = cls._meta.pk.attname
 
-        while stack:
-            parent, node_struct = stack.pop()
-            # shallow copy of the data structure so it doesn't persist...
-            node_data = node_struct['data'].copy()
-            cls._process_foreign_keys(foreign_keys, node_data)
-            if keep_ids:
-                node_data[pk_field] = node_struct[pk_field]
-            if parent:
-                node_obj = parent.add_child(**node_data)
-            else:
-                node_obj = cls.add_root(**node_data)
-            added.append(node_obj.pk)
-            if 'children' in node_struct:
-                # extending the stack with the current node as the parent of
-                # the new nodes
-                stack.extend([
-                    (node_obj, node)
-                    for node in node_struct['children'][::-1]
-                ])
+        # the loop runs once per node, avoid repeated attribute lookups
+        pop, extend = stack.pop, stack.extend
+        process_foreign_keys = cls._process_foreign_keys
+        add_root = cls.add_root
+        with transaction.atomic(
+                using=cls._get_database_connection('write').alias,
+                savepoint=False):
+            while stack:
+                parent, node_struct = pop()
+                node_data = node_struct['data']
+                if foreign_keys or keep_ids:
+                    # shallow copy of the data so the changes don't persist
+                    node_data = node_data.copy()
+                if foreign_keys:
+                    process_foreign_keys(foreign_keys, node_data)
+                if keep_ids:
+                    node_data[pk_field] = node_struct[pk_field]
+                if parent:
+                    node_obj = parent.add_child(**node_data)
+                else:
+                    node_obj = add_root(**node_data)
+                added.append(node_obj.pk)
+                if 'children' in node_struct:
+                    # extending the stack with the current node as the parent
+                    # of the new nodes
+                    extend(
+                        (node_obj, node)
+                        for node in reversed(node_struct['children'])
+                    )
         return added
 
     @classmethod
@@ -155,10 +162,7 @@ class Node(models.Model):
 
             The first root node in the tree or ``None`` if it is empty.
         """
-        try:
-            return cls.get_root_nodes()[0]
-        except IndexError:
-            return None
+        return cls.get_root_nodes().first()
 
     @classmethod
     def get_last_root_node(cls):
@@ -167,10 +171,7 @@ class Node(models.Model):
 
             The last root node in the tree or ``None`` if it is empty.
         """
-        try:
-            return cls.get_root_nodes().reverse()[0]
-        except IndexError:
-            return None
+        return cls.get_root_nodes().last()
 
     @classmethod
     def find_problems(cls):  # pragma: no cover
@@ -260,10 +261,7 @@ class Node(models.Model):
 
             The leftmost node's child, or None if it has no children.
         """
-        try:
-            return self.get_children()[0]
-        except IndexError:
-            return None
+        return self.get_children().first()
 
     def get_last_child(self):
         """
@@ -271,10 +269,7 @@ class Node(models.Model):
 
             The rightmost node's child, or None if it has no children.
         """
-        try:
-            return self.get_children().reverse()[0]
-        except IndexError:
-            return None
+        return self.get_children().last()
 
     def get_first_sibling(self):
         """
@@ -283,7 +278,7 @@ class Node(models.Model):
             The leftmost node's sibling, can return the node itself if
             it was the leftmost sibling.
         """
-        return self.get_siblings()[0]
+        return self.get_siblings().first()
 
     def get_last_sibling(self):
         """
@@ -292,7 +287,7 @@ class Node(models.Model):
             The rightmost node's sibling, can return the node itself if
             it was the rightmost sibling.
         """
-        return self.get_siblings().reverse()[0]
+        return self.get_siblings().last()
 
     def get_prev_sibling(self):
         """
@@ -301,12 +296,11 @@ class Node(models.Model):
             The previous node's sibling, or None if it was the leftmost
             sibling.
         """
-        siblings = self.get_siblings()
-        ids = [obj.pk for obj in siblings]
-        if self.pk in ids:
-            idx = ids.index(self.pk)
-            if idx > 0:
-                return siblings[idx - 1]
+        prev = None
+        for sibling in self.get_siblings():
+            if sibling.pk == self.pk:
+                return prev
+            prev = sibling
 
     def get_next_sibling(self):
         """
@@ -315,12 +309,11 @@ class Node(models.Model):
             The next node's sibling, or None if it was the rightmost
             sibling.
         """
-        siblings = self.get_siblings()
-        ids = [obj.pk for obj in siblings]
-        if self.pk in ids:
-            idx = ids.index(self.pk)
-            if idx < len(siblings) - 1:
-                return siblings[idx + 1]
+        found = False
+        for sibling in self.get_siblings():
+            if found:
+                return sibling
+            found = sibling.pk == self.pk
 
     def is_sibling_of(self, node):
         """
@@ -447,6 +440,16 @@ class Node(models.Model):
         """
         raise NotImplementedError
 
+    @classmethod
+    def _prefetch_parents(cls, nodes):
+        """
+        Caches the parents of many nodes with as few queries as possible, so
+        that calling :meth:`get_parent` on every node doesn't query the
+        database once per node.
+
+        The default implementation does nothing.
+        """
+
     def move(self, target, pos=None):  # pragma: no cover
         """
         Moves the current node and all it's descendants to a new position
@@ -557,17 +560,18 @@ class Node(models.Model):
         https://github.com/django-mptt/django-mptt/blob/0.3.0/mptt/signals.py
         """
 
-        fields, filters = [], []
-        for field in self.node_order_by:
+        # lexicographic "greater than" on the node_order_by fields, nested
+        # from the last field so that every field is compared only once:
+        # f1 > v1 OR (f1 = v1 AND (f2 > v2 OR (f2 = v2 AND ...)))
+        condition = None
+        for field in reversed(self.node_order_by):
             value = getattr(newobj, field)
-            filters.append(
-                Q(
-                    *[Q(**{f: v}) for f, v in fields] +
-                     [Q(**{'%s__gt' % field: value})]
-                )
-            )
-            fields.append((field, value))
-        return siblings.filter(reduce(operator.or_, filters))
+            greater = Q(**{'%s__gt' % field: value})
+            if condition is None:
+                condition = greater
+            else:
+                condition = greater | (Q(**{field: value}) & condition)
+        return siblings.filter(condition)
 
     @classmethod
     def get_annotated_list_qs(cls, qs):
@@ -629,10 +633,11 @@ class Node(models.Model):
 
     @classmethod
     def _get_database_connection(cls, action):
-        return {
-            'read': connections[router.db_for_read(cls)],
-            'write': connections[router.db_for_write(cls)]
-        }[action]
+        # only the router for the requested action is asked
+        return connections[{
+            'read': router.db_for_read,
+            'write': router.db_for_write
+        }[action](cls)]
 
     @classmethod
     def get_database_vendor(cls, action):
@@ -1,12 +1,14 @@
 """Materialized Path Trees"""
 
 import operator
-from functools import reduce
+from functools import lru_cache
+from itertools import groupby, repeat
 
 from django.core import serializers
 from django.db import models, transaction, connection
-from django.db.models import F, Q, Value
+from django.db.models import Case, F, Q, Value, When
 from django.db.models.functions import Concat, Substr
+from django.db.models.signals import post_save, pre_save
 from django.utils.translation import gettext_noop as _
 
 from treebeard.numconv import NumConv
@@ -43,6 +45,55 @@ def sql_substr(field, pos, length=None, **kwargs):
     return function.format(field=field, pos=pos, length=length)
 
 
+# The sql templates only depend on a few values, and are generated again and
+# again while adding and moving nodes, so they are cached
+@lru_cache(maxsize=None)
+def _get_sql_newpath_in_branches(table, vendor):
+    sqlpath = sql_concat("%s", sql_substr("path", "%s", vendor=vendor), vendor=vendor)
+    # all the nodes in the branch move up or down by the same number of
+    # levels; the depth is always set (maybe adding 0) so that all the moves
+    # share the same statement
+    return "UPDATE %s SET path=%s, depth=depth+%%s" \
+           " WHERE path BETWEEN %%s AND %%s" % (table, sqlpath)
+
+
+@lru_cache(maxsize=None)
+def _get_sql_update_numchild(table, incdec):
+    return "UPDATE %s SET numchild=numchild%s1 WHERE path=%%s" % (
+        table, {'inc': '+', 'dec': '-'}[incdec])
+
+
+@lru_cache(maxsize=None)
+def _get_sql_update_numchild_deltas(table, count):
+    return ("UPDATE " + table + " SET numchild=numchild+CASE path" +
+            " WHEN %s THEN %s" * count +
+            " END WHERE path IN (" + ", ".join(["%s"] * count) + ")")
+
+
+@lru_cache(maxsize=None)
+def _get_numconv(alphabet):
+    """:returns: The converter for the steps of paths using an alphabet."""
+    return NumConv(len(alphabet), alphabet)
+
+
+@lru_cache(maxsize=None)
+def _get_children_path_suffixes(alphabet, steplen):
+    """
+    :returns: The suffixes appended to a path to get the interval of its
+              children paths.
+    """
+    return alphabet[0] * steplen, alphabet[-1] * steplen
+
+
+@lru_cache(maxsize=None)
+def _get_next_digits(alphabet):
+    """
+    :returns: A dict with the digit following every digit of an alphabet,
+              and None for the last one.
+    """
+    return dict(zip(alphabet, list(alphabet[1:]) + [None]))
+
+
 def get_result_class(cls):
     """
     For the given model class, determine what class we should use for the
@@ -82,50 +133,87 @@ class MP_NodeQuerySet(models.query.QuerySet):
         :returns: tuple of the number of objects deleted and a dictionary
                   with the number of deletions per object type
         """
+        model = get_result_class(self.model)
+        if (
+                not self.query.has_filters() and
+                not self.query.is_sliced and
+                self.model._meta.concrete_model is model._meta.concrete_model
+        ):
+            # removing the whole tree, no need to look for the nodes and
+            # parents involved; Django still takes care of the related
+            # objects and signals
+            return super().delete(*args, **kwargs)
+
         # we'll have to manually run through all the nodes that are going
         # to be deleted and remove nodes from the list if an ancestor is
         # already getting removed, since that would be redundant
         removed = {}
-        for node in self.order_by('depth', 'path'):
-            found = False
-            for depth in range(1, int(len(node.path) / node.steplen)):
-                path = node._get_basepath(node.path, depth)
-                if path in removed:
-                    # we are already removing a parent of this node
-                    # skip
-                    found = True
-                    break
-            if not found:
-                removed[node.path] = node
+        # in path order the descendants of a node come right after it, so
+        # an ancestor that is already getting removed can only be the last
+        # removed path
+        lastpath = None
+        # only the tree fields are needed, streamed instead of loading every
+        # node to be deleted in memory at once
+        nodes = self.order_by('path').values_list(
+            'path', 'depth', 'numchild').iterator(chunk_size=2000)
+        for path, depth, numchild in nodes:
+            if lastpath is not None and path.startswith(lastpath):
+                # we are already removing a parent of this node
+                # skip
+                continue
+            lastpath = path
+            removed[path] = depth, numchild
 
         # ok, got the minimal list of nodes to remove...
         # we must also remove their children
         # and update every parent node's numchild attribute
         # LOTS OF FUN HERE!
-        parents = {}
-        toremove = []
-        for path, node in removed.items():
-            parentpath = node._get_basepath(node.path, node.depth - 1)
+        removed_children = {}
+        leafpaths, toremove = [], []
+        for path, (depth, numchild) in removed.items():
+            parentpath = model._get_basepath(path, depth - 1)
             if parentpath:
-                if parentpath not in parents:
-                    parents[parentpath] = node.get_parent(True)
-                parent = parents[parentpath]
-                if parent and parent.numchild > 0:
-                    parent.numchild -= 1
-                    parent.save()
-            if node.is_leaf():
-                toremove.append(Q(path=node.path))
+                removed_children[parentpath] = removed_children.get(
+                    parentpath, 0) + 1
+            if not numchild:
+                leafpaths.append(path)
             else:
-                toremove.append(Q(path__startswith=node.path))
-
-        # Django will handle this as a SELECT and then a DELETE of
-        # ids, and will deal with removing related objects
-        model = get_result_class(self.model)
-        if toremove:
-            qset = model.objects.filter(reduce(operator.or_, toremove))
-        else:
-            qset = model.objects.none()
-        return super(MP_NodeQuerySet, qset).delete(*args, **kwargs)
+                toremove.append(Q(
+                    path__range=model._get_descendants_path_interval(path)))
+        if leafpaths:
+            # all the leaves can go in a single IN clause
+            toremove.append(Q(path__in=leafpaths))
+
+        # the parents that lose the same number of children are updated
+        # together, in as few queries as the database allows
+        paths_by_count = {}
+        for path, count in removed_children.items():
+            paths_by_count.setdefault(count, []).append(path)
+
+        # the parents are only updated if their children are removed too
+        db_connection = model._get_database_connection('write')
+        with transaction.atomic(using=db_connection.alias, savepoint=False):
+            for count, paths in paths_by_count.items():
+                # without letting numchild go below 0 if it was already wrong
+                numchild = Case(
+                    When(numchild__gt=count, then=F('numchild') - count),
+                    default=Value(0))
+                batch_size = db_connection.ops.bulk_batch_size(
+                    ['path'], paths)
+                for start in range(0, len(paths), batch_size):
+                    model.objects.filter(
+                        path__in=paths[start:start + batch_size]
+                    ).update(numchild=numchild)
+
+            # Django will handle this as a SELECT and then a DELETE of
+            # ids, and will deal with removing related objects
+            if toremove:
+                # a flat OR instead of OR-ing the Q objects one by one, which
+                # copies the growing condition on every step
+                qset = model.objects.filter(Q(*toremove, _connector=Q.OR))
+            else:
+                qset = model.objects.none()
+            return super(MP_NodeQuerySet, qset).delete(*args, **kwargs)
 
     delete.alters_data = True
     delete.queryset_only = True
@@ -138,28 +226,90 @@ class MP_NodeManager(models.Manager):
         return MP_NodeQuerySet(self.model).order_by('path')
 
 
+# moving to a child of a non-leaf node is a move relative to its last child
+_CHILD_TO_SIBLING_POS = {
+    'first-child': 'first-sibling',
+    'last-child': 'last-sibling',
+    'sorted-child': 'sorted-sibling',
+}
+
+
 class MP_AddHandler(object):
     def __init__(self):
         self.stmts = []
 
 
 class MP_ComplexAddMoveHandler(MP_AddHandler):
+    def __init__(self):
+        super().__init__()
+        self.last_sibling_paths = {}
+        self.db_connection = None
+
+    def get_last_sibling_path(self, node):
+        """
+        :returns: The path of the last sibling of a node.
+
+        The sql statements are only run at the end, so the result can be
+        shared by all the siblings for the whole operation.
+        """
+        parentpath = self.node_cls._get_parent_path_from_path(node.path)
+        try:
+            return self.last_sibling_paths[parentpath]
+        except KeyError:
+            path = node.get_siblings().values_list('path', flat=True).last()
+            self.last_sibling_paths[parentpath] = path
+            return path
+
+    def get_db_connection(self):
+        """
+        :returns: The connection used to write the changes, routed only once
+                  for the whole operation.
+        """
+        if self.db_connection is None:
+            self.db_connection = self.node_cls._get_database_connection(
+                'write')
+        return self.db_connection
 
     def run_sql_stmts(self):
-        cursor = self.node_cls._get_database_cursor('write')
-        for sql, vals in self.stmts:
-            cursor.execute(sql, vals)
+        db_connection = self.get_db_connection()
+        if len(self.stmts) == 1:
+            # a single statement is atomic already
+            db_connection.cursor().execute(*self.stmts[0])
+            return
+        # the statements only leave a consistent tree when all of them run;
+        # no savepoint is needed when already in a transaction, since a
+        # failure leaves the tree broken anyway
+        with transaction.atomic(using=db_connection.alias, savepoint=False):
+            cursor = db_connection.cursor()
+            # consecutive statements sharing the same sql (like the ones
+            # that shift a run of siblings to the right) are sent in a
+            # single batch, keeping their order since each one makes room
+            # for the next
+            for sql, stmts in groupby(
+                    self.stmts, key=operator.itemgetter(0)):
+                cursor.executemany(sql, [vals for _, vals in stmts])
 
     def get_sql_update_numchild(self, path, incdec='inc'):
         """:returns: The sql needed the numchild value of a node"""
-        sql = "UPDATE %s SET numchild=numchild%s1"\
-              " WHERE path=%%s" % (
-                  connection.ops.quote_name(
-                      get_result_class(self.node_cls)._meta.db_table),
-                  {'inc': '+', 'dec': '-'}[incdec])
+        sql = _get_sql_update_numchild(
+            self.node_cls._get_db_table_sql(), incdec)
         vals = [path]
         return sql, vals
 
+    def get_sql_update_numchild_deltas(self, deltas):
+        """
+        :returns: The sql needed to change the numchild value of several
+                  nodes in a single statement, from a dict of paths and the
+                  number of children added (or removed) to each one.
+        """
+        sql = _get_sql_update_numchild_deltas(
+            self.node_cls._get_db_table_sql(), len(deltas))
+        vals = []
+        for path, delta in deltas.items():
+            vals.extend([path, delta])
+        vals.extend(deltas)
+        return sql, vals
+
     def reorder_nodes_before_add_or_move(self, pos, newpos, newdepth, target,
                                          siblings, oldpath=None,
                                          movebranch=False):
@@ -171,11 +321,12 @@ class MP_ComplexAddMoveHandler(MP_AddHandler):
         """
         if (
                 (pos == 'last-sibling') or
-                (pos == 'right' and target == target.get_last_sibling())
+                (pos == 'right' and
+                 target.path == self.get_last_sibling_path(target))
         ):
             # easy, the last node
-            last = target.get_last_sibling()
-            newpath = last._inc_path()
+            newpath = self.node_cls._get_next_path(
+                self.get_last_sibling_path(target))
             if movebranch:
                 self.stmts.append(
                     self.get_sql_newpath_in_branches(oldpath, newpath))
@@ -184,34 +335,37 @@ class MP_ComplexAddMoveHandler(MP_AddHandler):
 
             if newpos is None:
                 siblings = target.get_siblings()
-                siblings = {'left': siblings.filter(path__gte=target.path),
-                            'right': siblings.filter(path__gt=target.path),
-                            'first-sibling': siblings}[pos]
-                basenum = target._get_lastpos_in_path()
-                newpos = {'first-sibling': 1,
-                          'left': basenum,
-                          'right': basenum + 1}[pos]
+                if pos == 'first-sibling':
+                    newpos = 1
+                elif pos == 'left':
+                    siblings = siblings.filter(path__gte=target.path)
+                    newpos = target._get_lastpos_in_path()
+                else:
+                    # right
+                    siblings = siblings.filter(path__gt=target.path)
+                    newpos = target._get_lastpos_in_path() + 1
 
             newpath = self.node_cls._get_path(target.path, newdepth, newpos)
+            # only the paths of the siblings are needed
+            siblings = siblings.values_list('path', flat=True)
 
             # If the move is amongst siblings and is to the left and there
             # are siblings to the right of its new position then to be on
             # the safe side we temporarily dump it on the end of the list
             tempnewpath = None
             if movebranch and len(oldpath) == len(newpath):
-                parentoldpath = self.node_cls._get_basepath(
-                    oldpath,
-                    int(len(oldpath) / self.node_cls.steplen) - 1
-                )
-                parentnewpath = self.node_cls._get_basepath(
-                    newpath, newdepth - 1)
+                parentoldpath = self.node_cls._get_parent_path_from_path(
+                    oldpath)
+                parentnewpath = self.node_cls._get_parent_path_from_path(
+                    newpath)
                 if (
                     parentoldpath == parentnewpath and
                     siblings and
                     newpath < oldpath
                 ):
-                    last = target.get_last_sibling()
-                    basenum = last._get_lastpos_in_path()
+                    lastpath = self.get_last_sibling_path(target)
+                    basenum = self.node_cls._str2int(
+                        lastpath[-self.node_cls.steplen:])
                     tempnewpath = self.node_cls._get_path(
                         newpath, newdepth, basenum + 2)
                     self.stmts.append(
@@ -222,35 +376,37 @@ class MP_ComplexAddMoveHandler(MP_AddHandler):
             # (i.e. if we've got holes, allow them to compress)
             movesiblings = []
             priorpath = newpath
-            for node in siblings:
+            for path in siblings:
                 # If the path of the node is already greater than the path
                 # of the previous node it doesn't need shifting
-                if node.path > priorpath:
+                if path > priorpath:
                     break
-                # It does need shifting, so add to the list
-                movesiblings.append(node)
                 # Calculate the path that it would be moved to, as that's
                 # the next "priorpath"
-                priorpath = node._inc_path()
+                incpath = self.node_cls._get_next_path(path)
+                # It does need shifting, so add to the list
+                movesiblings.append((path, incpath))
+                priorpath = incpath
             movesiblings.reverse()
 
-            for node in movesiblings:
+            # all the siblings have paths of the same length
+            steppos = len(newpath)
+            for path, incpath in movesiblings:
                 # moving the siblings (and their branches) at the right of the
                 # related position one step to the right
-                sql, vals = self.get_sql_newpath_in_branches(
-                    node.path, node._inc_path())
-                self.stmts.append((sql, vals))
+                self.stmts.append(
+                    self.get_sql_newpath_in_branches(path, incpath))
 
                 if movebranch:
-                    if oldpath.startswith(node.path):
+                    if oldpath[:steppos] == path:
                         # if moving to a parent, update oldpath since we just
                         # increased the path of the entire branch
-                        oldpath = vals[0] + oldpath[len(vals[0]):]
-                    if target.path.startswith(node.path):
+                        oldpath = incpath + oldpath[steppos:]
+                    if target.path[:steppos] == path:
                         # and if we moved the target, update the object
                         # django made for us, since the update won't do it
                         # maybe useful in loops
-                        target.path = vals[0] + target.path[len(vals[0]):]
+                        target.path = incpath + target.path[steppos:]
             if movebranch:
                 # node to move
                 if tempnewpath:
@@ -266,39 +422,13 @@ class MP_ComplexAddMoveHandler(MP_AddHandler):
     def get_sql_newpath_in_branches(self, oldpath, newpath):
         """
         :returns: The sql needed to move a branch to another position.
-
-        .. note::
-
-           The generated sql will only update the depth values if needed.
-
         """
-
-        vendor = self.node_cls.get_database_vendor('write')
-        sql1 = "UPDATE %s SET" % (
-            connection.ops.quote_name(
-                get_result_class(self.node_cls)._meta.db_table), )
-
-        if vendor == 'mysql':
-            # hooray for mysql ignoring standards in their default
-            # configuration!
-            # to make || work as it should, enable ansi mode
-            # http://dev.mysql.com/doc/refman/5.0/en/ansi-mode.html
-            sqlpath = "CONCAT(%s, SUBSTR(path, %s))"
-        else:
-            sqlpath = sql_concat("%s", sql_substr("path", "%s", vendor=vendor), vendor=vendor)
-
-        sql2 = ["path=%s" % (sqlpath, )]
-        vals = [newpath, len(oldpath) + 1]
-        if len(oldpath) != len(newpath) and vendor != 'mysql':
-            # when using mysql, this won't update the depth and it has to be
-            # done in another query
-            # doesn't even work with sql_mode='ANSI,TRADITIONAL'
-            # TODO: FIND OUT WHY?!?? right now I'm just blaming mysql
-            sql2.append(("depth=" + sql_length("%s", vendor=vendor) + "/%%s") % (sqlpath, ))
-            vals.extend([newpath, len(oldpath) + 1, self.node_cls.steplen])
-        sql3 = "WHERE path LIKE %s"
-        vals.extend([oldpath + '%'])
-        sql = '%s %s %s' % (sql1, ', '.join(sql2), sql3)
+        sql = _get_sql_newpath_in_branches(
+            self.node_cls._get_db_table_sql(),
+            self.get_db_connection().vendor)
+        vals = [newpath, len(oldpath) + 1,
+                (len(newpath) - len(oldpath)) // self.node_cls.steplen]
+        vals.extend(self.node_cls._get_descendants_path_interval(oldpath))
         return sql, vals
 
 
@@ -307,24 +437,33 @@ class MP_AddRootHandler(MP_AddHandler):
         super().__init__()
         self.cls = cls
         self.kwargs = kwargs
+        # path of the last root node, when already known by the caller
+        self.last_path = None
 
     def process(self):
+        if self.cls.node_order_by:
+            last_root = self.cls.get_last_root_node()
+            if last_root:
+                # there are root nodes and node_order_by has been set
+                # delegate sorted insertion to add_sibling
+                return last_root.add_sibling('sorted-sibling', **self.kwargs)
+            last_path = None
+        elif self.last_path is not None:
+            last_path = self.last_path
+        else:
+            # do we have a root node already? only its path is needed
+            last_path = self.cls.get_root_nodes().values_list(
+                'path', flat=True).last()
 
-        # do we have a root node already?
-        last_root = self.cls.get_last_root_node()
-
-        if last_root and last_root.node_order_by:
-            # there are root nodes and node_order_by has been set
-            # delegate sorted insertion to add_sibling
-            return last_root.add_sibling('sorted-sibling', **self.kwargs)
-
-        if last_root:
+        if last_path:
             # adding the new root node as the last one
-            newpath = last_root._inc_path()
+            newpath = self.cls._get_next_path(last_path)
         else:
             # adding the first root node
             newpath = self.cls._get_path(None, 1, 1)
+        return self.add_root(newpath)
 
+    def add_root(self, newpath):
         if len(self.kwargs) == 1 and 'instance' in self.kwargs:
             # adding the passed (unsaved) instance to the tree
             newobj = self.kwargs['instance']
@@ -348,6 +487,11 @@ class MP_AddChildHandler(MP_AddHandler):
         self.node = node
         self.node_cls = node.__class__
         self.kwargs = kwargs
+        # path of the node's last child, when already known by the caller
+        self.last_path = None
+        # when set by the caller, the numchild increments of the parent node
+        # are added to this dict (by path) instead of being saved
+        self.numchild_deltas = None
 
     def process(self):
         if self.node_cls.node_order_by and not self.node.is_leaf():
@@ -378,12 +522,21 @@ class MP_AddChildHandler(MP_AddHandler):
                     _('The new node is too deep in the tree, try'
                       ' increasing the path.max_length property'
                       ' and UPDATE your database'))
+        elif self.last_path is not None:
+            # adding the new child after the known last one
+            newobj.path = self.node_cls._get_next_path(self.last_path)
         else:
-            # adding the new child as the last one
-            newobj.path = self.node.get_last_child()._inc_path()
-
-        get_result_class(self.node_cls).objects.filter(
-            path=self.node.path).update(numchild=F('numchild')+1)
+            # adding the new child as the last one, only its path is needed
+            newobj.path = self.node_cls._get_next_path(
+                self.node.get_children().values_list(
+                    'path', flat=True).last())
+
+        if self.numchild_deltas is None:
+            get_result_class(self.node_cls).objects.filter(
+                path=self.node.path).update(numchild=F('numchild')+1)
+        else:
+            self.numchild_deltas[self.node.path] = self.numchild_deltas.get(
+                self.node.path, 0) + 1
 
         # we increase the numchild value of the object in memory
         self.node.numchild += 1
@@ -421,12 +574,15 @@ class MP_AddSiblingHandler(MP_ComplexAddMoveHandler):
         if self.pos == 'sorted-sibling':
             siblings = self.node.get_sorted_pos_queryset(
                 self.node.get_siblings(), newobj)
-            try:
-                newpos = siblings.all()[0]._get_lastpos_in_path()
-            except IndexError:
+            # only the path of the first sibling after the new position is
+            # needed
+            firstpath = siblings.values_list('path', flat=True).first()
+            if firstpath is None:
                 newpos = None
-            if newpos is None:
                 self.pos = 'last-sibling'
+            else:
+                newpos = self.node_cls._str2int(
+                    firstpath[-self.node_cls.steplen:])
         else:
             newpos, siblings = None, []
 
@@ -439,11 +595,15 @@ class MP_AddSiblingHandler(MP_ComplexAddMoveHandler):
             self.stmts.append(
                 self.get_sql_update_numchild(parentpath, 'inc'))
 
-        self.run_sql_stmts()
+        # the siblings are only moved to make room for the new node, so the
+        # new node is saved in the same transaction
+        with transaction.atomic(using=self.get_db_connection().alias,
+                                savepoint=False):
+            self.run_sql_stmts()
 
-        # saving the instance before returning it
-        newobj.path = newpath
-        newobj.save()
+            # saving the instance before returning it
+            newobj.path = newpath
+            newobj.save()
 
         return newobj
 
@@ -477,11 +637,13 @@ class MP_MoveHandler(MP_ComplexAddMoveHandler):
                 (self.pos == 'left') or
                 (
                     self.pos in ('right', 'last-sibling') and
-                    self.target.path == self.target.get_last_sibling().path
+                    self.target.path ==
+                    self.get_last_sibling_path(self.target)
                 ) or
                 (
                     self.pos == 'first-sibling' and
-                    self.target.path == self.target.get_first_sibling().path
+                    self.target.path == self.target.get_siblings(
+                    ).values_list('path', flat=True).first()
                 )
             )
         ):
@@ -491,12 +653,15 @@ class MP_MoveHandler(MP_ComplexAddMoveHandler):
         if self.pos == 'sorted-sibling':
             siblings = self.node.get_sorted_pos_queryset(
                 self.target.get_siblings(), self.node)
-            try:
-                newpos = siblings.all()[0]._get_lastpos_in_path()
-            except IndexError:
+            # only the path of the first sibling after the new position is
+            # needed
+            firstpath = siblings.values_list('path', flat=True).first()
+            if firstpath is None:
                 newpos = None
-            if newpos is None:
                 self.pos = 'last-sibling'
+            else:
+                newpos = self.node_cls._str2int(
+                    firstpath[-self.node_cls.steplen:])
 
         # generate the sql that will do the actual moving of nodes
         oldpath, newpath = self.reorder_nodes_before_add_or_move(
@@ -508,32 +673,22 @@ class MP_MoveHandler(MP_ComplexAddMoveHandler):
 
     def sanity_updates_after_move(self, oldpath, newpath):
         """
-        Updates the list of sql statements needed after moving nodes.
-
-        1. :attr:`depth` updates *ONLY* needed by mysql databases (*sigh*)
-        2. update the number of children of parent nodes
+        Updates the list of sql statements needed after moving nodes: the
+        number of children of the old and new parent nodes.
         """
-        if (
-                self.node_cls.get_database_vendor('write') == 'mysql' and
-                len(oldpath) != len(newpath)
-        ):
-            # no words can describe how dumb mysql is
-            # we must update the depth of the branch in a different query
-            self.stmts.append(
-                self.get_mysql_update_depth_in_branch(newpath))
-
-        oldparentpath = self.node_cls._get_parent_path_from_path(oldpath)
-        newparentpath = self.node_cls._get_parent_path_from_path(newpath)
-        if (
-                (not oldparentpath and newparentpath) or
-                (oldparentpath and not newparentpath) or
-                (oldparentpath != newparentpath)
-        ):
+        # the paths of moved nodes are never empty
+        steplen = self.node_cls.steplen
+        oldparentpath, newparentpath = oldpath[:-steplen], newpath[:-steplen]
+        if oldparentpath != newparentpath:
             # node changed parent, updating count
-            if oldparentpath:
+            if oldparentpath and newparentpath:
+                # both parents are updated in the same statement
+                self.stmts.append(self.get_sql_update_numchild_deltas(
+                    {oldparentpath: -1, newparentpath: 1}))
+            elif oldparentpath:
                 self.stmts.append(
                     self.get_sql_update_numchild(oldparentpath, 'dec'))
-            if newparentpath:
+            elif newparentpath:
                 self.stmts.append(
                     self.get_sql_update_numchild(newparentpath, 'inc'))
 
@@ -542,7 +697,7 @@ class MP_MoveHandler(MP_ComplexAddMoveHandler):
         newdepth = self.target.depth
         newpos = None
         siblings = []
-        if self.pos in ('first-child', 'last-child', 'sorted-child'):
+        if self.pos in _CHILD_TO_SIBLING_POS:
             # moving to a child
             parent = self.target
             newdepth += 1
@@ -553,10 +708,7 @@ class MP_MoveHandler(MP_ComplexAddMoveHandler):
                 siblings = get_result_class(self.node_cls).objects.none()
             else:
                 self.target = self.target.get_last_child()
-                self.pos = {
-                    'first-child': 'first-sibling',
-                    'last-child': 'last-sibling',
-                    'sorted-child': 'sorted-sibling'}[self.pos]
+                self.pos = _CHILD_TO_SIBLING_POS[self.pos]
 
             # this is not for save(), since if needed, will be handled with a
             # custom UPDATE, this is only here to update django's object,
@@ -565,18 +717,6 @@ class MP_MoveHandler(MP_ComplexAddMoveHandler):
 
         return newdepth, siblings, newpos
 
-    def get_mysql_update_depth_in_branch(self, path):
-        """
-        :returns: The sql needed to update the depth of all the nodes in a
-                  branch.
-        """
-        vendor = self.node_cls.get_database_vendor('write')
-        sql = ("UPDATE %s SET depth=" + sql_length("path", vendor=vendor) + "/%%s WHERE path LIKE %%s") % (
-            connection.ops.quote_name(
-                get_result_class(self.node_cls)._meta.db_table), )
-        vals = [self.node_cls.steplen, path + '%']
-        return sql, vals
-
 
 class MP_Node(Node):
     """Abstract model to create your own Materialized Path Trees."""
@@ -590,7 +730,17 @@ class MP_Node(Node):
 
     objects = MP_NodeManager()
 
-    numconv_obj_ = None
+    # quoted name of the table updated by the tree sql statements, see
+    # _get_db_table_sql()
+    _db_table_sql = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if int(cls.steplen) != cls.steplen or cls.steplen < 1:
+            raise ValueError('%s.steplen must be a positive integer' % (
+                cls.__name__, ))
+        # validates the alphabet
+        cls.numconv_obj()
 
     @classmethod
     def _int2str(cls, num):
@@ -602,9 +752,22 @@ class MP_Node(Node):
 
     @classmethod
     def numconv_obj(cls):
-        if cls.numconv_obj_ is None:
-            cls.numconv_obj_ = NumConv(len(cls.alphabet), cls.alphabet)
-        return cls.numconv_obj_
+        # everything derived from the alphabet is cached per alphabet, so a
+        # model whose alphabet is changed never uses stale values
+        return _get_numconv(cls.alphabet)
+
+    @classmethod
+    def _get_db_table_sql(cls):
+        """
+        :returns: The quoted name of the table holding the tree.
+
+        Subclasses and proxy models share the table of the model that defines
+        the tree, so the value can be inherited by them.
+        """
+        if cls._db_table_sql is None:
+            cls._db_table_sql = connection.ops.quote_name(
+                get_result_class(cls)._meta.db_table)
+        return cls._db_table_sql
 
     @classmethod
     def add_root(cls, **kwargs):
@@ -621,6 +784,194 @@ class MP_Node(Node):
         """
         return MP_AddRootHandler(cls, **kwargs).process()
 
+    @classmethod
+    def load_bulk(cls, bulk_data, parent=None, keep_ids=False):
+        """Loads a list/dictionary structure to the tree."""
+
+        if cls._can_bulk_create_nodes():
+            return cls._bulk_create_nodes(bulk_data, parent, keep_ids)
+
+        # tree, iterative preorder
+        added = []
+        # stack of nodes to analyze
+        stack = [(parent, node) for node in reversed(bulk_data)]
+        foreign_keys = cls.get_foreign_keys()
+        pk_field = cls._meta.pk.attname
+        # nodes are always added as the last child of their parent, so we
+        # keep the path of the last child added to every parent ('' for
+        # the root nodes) instead of fetching it for every new node
+        last_paths = {}
+        # without node_order_by the paths of the added nodes never change
+        # during the load, so the numchild of every parent is updated only
+        # once at the end
+        numchild_deltas = None if cls.node_order_by else {}
+
+        # the loop runs once per node, avoid repeated attribute lookups
+        pop, extend = stack.pop, stack.extend
+        with transaction.atomic(
+                using=cls._get_database_connection('write').alias,
+                savepoint=False):
+            while stack:
+                parent, node_struct = pop()
+                node_data = node_struct['data']
+                if foreign_keys or keep_ids:
+                    # shallow copy of the data so the changes don't persist
+                    node_data = node_data.copy()
+                if foreign_keys:
+                    cls._process_foreign_keys(foreign_keys, node_data)
+                if keep_ids:
+                    node_data[pk_field] = node_struct[pk_field]
+                if parent:
+                    handler = MP_AddChildHandler(parent, **node_data)
+                    handler.numchild_deltas = numchild_deltas
+                    parentpath = parent.path
+                else:
+                    handler = MP_AddRootHandler(cls, **node_data)
+                    parentpath = ''
+                handler.last_path = last_paths.get(parentpath)
+                node_obj = handler.process()
+                last_paths[parentpath] = node_obj.path
+                added.append(node_obj.pk)
+                if 'children' in node_struct:
+                    # extending the stack with the current node as the parent
+                    # of the new nodes
+                    extend(
+                        (node_obj, node)
+                        for node in reversed(node_struct['children'])
+                    )
+            if numchild_deltas:
+                cls._update_numchild_deltas(numchild_deltas)
+        return added
+
+    @classmethod
+    def _update_numchild_deltas(cls, deltas):
+        """
+        Adds the number of children in ``deltas`` (a dict of paths and
+        counts) to the numchild of the nodes, with a single UPDATE for all
+        the nodes that got the same number of children.
+        """
+        paths_by_delta = {}
+        for path, delta in deltas.items():
+            paths_by_delta.setdefault(delta, []).append(path)
+        queryset = get_result_class(cls).objects
+        for delta, paths in paths_by_delta.items():
+            queryset.filter(path__in=paths).update(
+                numchild=F('numchild') + delta)
+
+    @classmethod
+    def _can_bulk_create_nodes(cls):
+        """
+        :returns: True if :meth:`load_bulk` can insert all the nodes with a
+            single ``bulk_create()``, meaning that nothing depends on
+            ``save()`` being called for every node and that the nodes don't
+            need to be sorted.
+        """
+        opts = cls._meta
+        return (
+            not cls.node_order_by and
+            cls.save is models.Model.save and
+            not pre_save.has_listeners(cls) and
+            not post_save.has_listeners(cls) and
+            all(
+                parent._meta.concrete_model is opts.concrete_model
+                for parent in opts.get_parent_list()
+            )
+        )
+
+    @classmethod
+    def _bulk_create_nodes(cls, bulk_data, parent=None, keep_ids=False):
+        """
+        Implementation of :meth:`load_bulk` that computes the paths of all
+        the new nodes in a single preorder traversal of ``bulk_data`` and
+        inserts them with ``bulk_create()``, instead of adding them one by
+        one.
+        """
+        max_length = cls._meta.get_field('path').max_length
+        foreign_keys = cls.get_foreign_keys()
+        pk_field = cls._meta.pk.attname
+
+        def get_paths(parentpath, depth, lastpath, structs):
+            # paths for a list of new siblings, after the last existing one
+            paths = []
+            for struct in structs:
+                if lastpath:
+                    lastpath = cls._get_next_path(lastpath)
+                else:
+                    lastpath = cls._get_path(parentpath, depth, 1)
+                    if len(lastpath) > max_length:
+                        raise PathOverflow(
+                            _('The new node is too deep in the tree, try'
+                              ' increasing the path.max_length property'
+                              ' and UPDATE your database'))
+                paths.append(lastpath)
+            return paths
+
+        if parent:
+            depth = parent.depth + 1
+            lastpath = parent.get_children().values_list(
+                'path', flat=True).last()
+            paths = get_paths(parent.path, depth, lastpath, bulk_data)
+        else:
+            depth = 1
+            lastpath = cls.get_root_nodes().values_list(
+                'path', flat=True).last()
+            paths = get_paths(None, depth, lastpath, bulk_data)
+
+        # tree, iterative preorder
+        nodes = []
+        # stack of nodes to analyze
+        stack = [
+            (path, depth, node)
+            for path, node in zip(reversed(paths), reversed(bulk_data))
+        ]
+        pop, extend = stack.pop, stack.extend
+        while stack:
+            path, depth, node_struct = pop()
+            node_data = node_struct['data']
+            if foreign_keys or keep_ids:
+                # shallow copy of the data so the changes don't persist
+                node_data = node_data.copy()
+            if foreign_keys:
+                cls._process_foreign_keys(foreign_keys, node_data)
+            if keep_ids:
+                node_data[pk_field] = node_struct[pk_field]
+            node_obj = cls(**node_data)
+            children = node_struct.get('children', [])
+            node_obj.path = path
+            node_obj.depth = depth
+            node_obj.numchild = len(children)
+            nodes.append(node_obj)
+            if children:
+                extend(zip(
+                    reversed(get_paths(path, depth + 1, None, children)),
+                    repeat(depth + 1),
+                    reversed(children)
+                ))
+
+        db_connection = cls._get_database_connection('write')
+        with transaction.atomic(using=db_connection.alias, savepoint=False):
+            cls.objects.bulk_create(nodes)
+            if parent and bulk_data:
+                get_result_class(cls).objects.filter(
+                    path=parent.path).update(
+                    numchild=F('numchild') + len(bulk_data))
+        if parent and bulk_data:
+            parent.numchild += len(bulk_data)
+        if nodes and nodes[0].pk is None:
+            # the database doesn't return the primary keys of the inserted
+            # rows, so they are looked up by path, in as few queries as the
+            # database allows
+            pks = {}
+            batch_size = db_connection.ops.bulk_batch_size(['path'], nodes)
+            for start in range(0, len(nodes), batch_size):
+                pks.update(cls.objects.filter(path__in=[
+                    node_obj.path
+                    for node_obj in nodes[start:start + batch_size]
+                ]).values_list('path', 'pk'))
+            for node_obj in nodes:
+                node_obj.pk = pks[node_obj.path]
+        return [node_obj.pk for node_obj in nodes]
+
     @classmethod
     def dump_bulk(cls, parent=None, keep_ids=True):
         """Dumps a tree branch to a python data structure."""
@@ -630,20 +981,28 @@ class MP_Node(Node):
         # Because of fix_tree, this method assumes that the depth
         # and numchild properties in the nodes can be incorrect,
         # so no helper methods are used
-        qset = cls._get_serializable_model().objects.all().order_by("depth", "path")
+        serializable_model = cls._get_serializable_model()
+        qset = serializable_model.objects.all().order_by("depth", "path")
         if parent:
-            qset = qset.filter(path__startswith=parent.path)
+            qset = qset.filter(
+                path__range=cls._get_descendants_path_interval(parent.path))
+        # depth and numchild will be useless in load_bulk, so they aren't
+        # serialized at all
+        selected_fields = [
+            field.name for field in
+            serializable_model._meta.local_fields +
+            serializable_model._meta.local_many_to_many
+            if field.name not in ('depth', 'numchild')]
         ret, lnk = [], {}
         pk_field = cls._meta.pk.attname
-        for pyobj in serializers.serialize('python', qset):
+        # the nodes are streamed, the serializer doesn't need the whole
+        # queryset in memory
+        for pyobj in serializers.serialize(
+                'python', qset.iterator(), fields=selected_fields):
             # django's serializer stores the attributes in 'fields'
             fields = pyobj['fields']
-            path = fields['path']
-            depth = int(len(path) / cls.steplen)
-            # this will be useless in load_bulk
-            del fields['depth']
-            del fields['path']
-            del fields['numchild']
+            path = fields.pop('path')
+            depth = len(path) // cls.steplen
             if pk_field in fields:
                 # this happens immediately after a load_bulk
                 del fields[pk_field]
@@ -656,8 +1015,7 @@ class MP_Node(Node):
                (parent and len(path) == len(parent.path)):
                 ret.append(newobj)
             else:
-                parentpath = cls._get_basepath(path, depth - 1)
-                parentobj = lnk[parentpath]
+                parentobj = lnk[path[:-cls.steplen]]
                 if 'children' not in parentobj:
                     parentobj['children'] = []
                 parentobj['children'].append(newobj)
@@ -709,7 +1067,7 @@ class MP_Node(Node):
                 orphans.append(node.pk)
                 continue
 
-            if node.depth != int(len(node.path) / cls.steplen):
+            if node.depth != len(node.path) // cls.steplen:
                 wrong_depth.append(node.pk)
                 continue
 
@@ -876,7 +1234,9 @@ class MP_Node(Node):
 
     @classmethod
     def _rewrite_node_path(cls, old_path, new_path):
-        cls.objects.filter(path__startswith=old_path).update(
+        cls.objects.filter(
+            path__range=cls._get_descendants_path_interval(old_path)
+        ).update(
             path=Concat(
                 Value(new_path),
                 Substr('path', len(old_path) + 1)
@@ -899,8 +1259,7 @@ class MP_Node(Node):
         if parent.is_leaf():
             return cls.objects.filter(pk=parent.pk)
         return cls.objects.filter(
-            path__startswith=parent.path,
-            depth__gte=parent.depth
+            path__range=cls._get_descendants_path_interval(parent.path)
         ).order_by(
             'path'
         )
@@ -1016,10 +1375,7 @@ class MP_Node(Node):
         :returns: The next node's sibling, or None if it was the rightmost
             sibling.
         """
-        try:
-            return self.get_siblings().filter(path__gt=self.path)[0]
-        except IndexError:
-            return None
+        return self.get_siblings().filter(path__gt=self.path).first()
 
     def get_descendants(self):
         """
@@ -1035,10 +1391,7 @@ class MP_Node(Node):
         :returns: The previous node's sibling, or None if it was the leftmost
             sibling.
         """
-        try:
-            return self.get_siblings().filter(path__lt=self.path).reverse()[0]
-        except IndexError:
-            return None
+        return self.get_siblings().filter(path__lt=self.path).last()
 
     def get_children_count(self):
         """
@@ -1052,28 +1405,25 @@ class MP_Node(Node):
         :returns: ``True`` if the node is a sibling of another node given as an
             argument, else, returns ``False``
         """
-        aux = self.depth == node.depth
-        # Check non-root nodes share a parent only if they have the same depth
-        if aux and self.depth > 1:
-            # making sure the non-root nodes share a parent
-            parentpath = self._get_basepath(self.path, self.depth - 1)
-            return aux and node.path.startswith(parentpath)
-        return aux
+        # nodes with the same depth are siblings if they share the path of
+        # their parent ('' for the root nodes)
+        return (self.depth == node.depth and
+                self.path[:-self.steplen] == node.path[:-self.steplen])
 
     def is_child_of(self, node):
         """
         :returns: ``True`` is the node if a child of another node given as an
             argument, else, returns ``False``
         """
-        return (self.path.startswith(node.path) and
-                self.depth == node.depth + 1)
+        return (self.depth == node.depth + 1 and
+                self.path.startswith(node.path))
 
     def is_descendant_of(self, node):
         """
         :returns: ``True`` if the node is a descendant of another node given
             as an argument, else, returns ``False``
         """
-        return self.path.startswith(node.path) and self.depth > node.depth
+        return self.depth > node.depth and self.path.startswith(node.path)
 
     def add_child(self, **kwargs):
         """
@@ -1125,20 +1475,16 @@ class MP_Node(Node):
         if self.is_root():
             return get_result_class(self.__class__).objects.none()
 
-        paths = [
-            self.path[0:pos]
-            for pos in range(0, len(self.path), self.steplen)[1:]
-        ]
         return get_result_class(self.__class__).objects.filter(
-            path__in=paths).order_by('depth')
+            path__in=self._get_ancestor_paths(self.path)).order_by('depth')
 
     def get_parent(self, update=False):
         """
         :returns: the parent node of the current node object.
             Caches the result in the object itself to help in loops.
         """
-        depth = int(len(self.path) / self.steplen)
-        if depth <= 1:
+        if len(self.path) <= self.steplen:
+            # root node
             return
         try:
             if update:
@@ -1147,11 +1493,34 @@ class MP_Node(Node):
                 return self._cached_parent_obj
         except AttributeError:
             pass
-        parentpath = self._get_basepath(self.path, depth - 1)
         self._cached_parent_obj = get_result_class(
-            self.__class__).objects.get(path=parentpath)
+            self.__class__).objects.get(path=self.path[:-self.steplen])
         return self._cached_parent_obj
 
+    @classmethod
+    def _prefetch_parents(cls, nodes):
+        """
+        Caches the parents of many nodes, looking them up by path in as few
+        queries as the database allows.
+        """
+        steplen = cls.steplen
+        nodes = [node for node in nodes if len(node.path) > steplen]
+        paths = list({node.path[:-steplen] for node in nodes})
+        if not paths:
+            return
+        parents = {}
+        queryset = get_result_class(cls).objects
+        batch_size = cls._get_database_connection(
+            'read').ops.bulk_batch_size(['path'], paths)
+        for start in range(0, len(paths), batch_size):
+            for parent in queryset.filter(
+                    path__in=paths[start:start + batch_size]):
+                parents[parent.path] = parent
+        for node in nodes:
+            parentpath = node.path[:-steplen]
+            if parentpath in parents:
+                node._cached_parent_obj = parents[parentpath]
+
     def move(self, target, pos=None):
         """
         Moves the current node and all it's descendants to a new position
@@ -1166,7 +1535,7 @@ class MP_Node(Node):
     def _get_basepath(cls, path, depth):
         """:returns: The base path of another path up to a given depth"""
         if path:
-            return path[0:depth * cls.steplen]
+            return path[:depth * cls.steplen]
         return ''
 
     @classmethod
@@ -1178,42 +1547,64 @@ class MP_Node(Node):
         :param depth: the depth of the  node
         :param newstep: the value (integer) of the new step
         """
-        parentpath = cls._get_basepath(path, depth - 1)
-        key = cls._int2str(newstep)
-        return '{0}{1}{2}'.format(
-            parentpath,
-            cls.alphabet[0] * (cls.steplen - len(key)),
-            key
-        )
+        steplen = cls.steplen
+        parentpath = path[:(depth - 1) * steplen] if path else ''
+        key = cls.numconv_obj().int2str(newstep)
+        return parentpath + key.rjust(steplen, cls.alphabet[0])
 
     def _inc_path(self):
         """:returns: The path of the next sibling of a given node path."""
-        newpos = self._str2int(self.path[-self.steplen:]) + 1
-        key = self._int2str(newpos)
-        if len(key) > self.steplen:
-            raise PathOverflow(_("Path Overflow from: '%s'" % (self.path, )))
-        return '{0}{1}{2}'.format(
-            self.path[:-self.steplen],
-            self.alphabet[0] * (self.steplen - len(key)),
-            key
-        )
+        return self._get_next_path(self.path)
+
+    @classmethod
+    def _get_next_path(cls, path):
+        """:returns: The path of the next sibling of a given path."""
+        # incrementing the last step in place: only the last characters that
+        # are already the last digit of the alphabet carry over
+        alphabet = cls.alphabet
+        next_digits = _get_next_digits(alphabet)
+        pos = len(path)
+        end = pos - cls.steplen
+        while pos > end:
+            pos -= 1
+            digit = next_digits[path[pos]]
+            if digit is not None:
+                return (path[:pos] + digit +
+                        alphabet[0] * (len(path) - pos - 1))
+        raise PathOverflow(_("Path Overflow from: '%s'" % (path, )))
 
     def _get_lastpos_in_path(self):
         """:returns: The integer value of the last step in a path."""
-        return self._str2int(self.path[-self.steplen:])
+        return self.numconv_obj().str2int(self.path[-self.steplen:])
 
     @classmethod
     def _get_parent_path_from_path(cls, path):
         """:returns: The parent path for a given path"""
         if path:
-            return path[0:len(path) - cls.steplen]
+            return path[:-cls.steplen]
         return ''
 
+    @classmethod
+    def _get_ancestor_paths(cls, path):
+        """:returns: A list of the paths of all the ancestors of a path"""
+        steplen = cls.steplen
+        return [path[:pos] for pos in range(steplen, len(path), steplen)]
+
+    @classmethod
+    def _get_descendants_path_interval(cls, path):
+        """
+        :returns: An interval of all possible paths of a node and its
+            descendants, usable as a range scan of the path index.
+        """
+        max_length = cls._meta.get_field('path').max_length
+        return (path,
+                path + cls.alphabet[-1] * (max_length - len(path)))
+
     @classmethod
     def _get_children_path_interval(cls, path):
         """:returns: An interval of all possible children paths for a node."""
-        return (path + cls.alphabet[0] * cls.steplen,
-                path + cls.alphabet[-1] * cls.steplen)
+        first, last = _get_children_path_suffixes(cls.alphabet, cls.steplen)
+        return path + first, path + last
 
     class Meta:
         """Abstract model."""
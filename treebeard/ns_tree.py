@@ -1,10 +1,7 @@
 """Nested Sets"""
 
-import operator
-from functools import reduce
-
 from django.core import serializers
-from django.db import connection, models
+from django.db import connection, models, transaction
 from django.db.models import Q
 from django.utils.translation import gettext_noop as _
 
@@ -109,9 +106,10 @@ class NS_NodeQuerySet(models.query.QuerySet):
                                 Q(tree_id=node.tree_id))
                 ranges.append((node.tree_id, node.lft, node.rgt))
             if toremove:
+                # a flat OR instead of OR-ing the Q objects one by one, which
+                # copies the growing condition on every step
                 deleted_counter = model.objects.filter(
-                    reduce(operator.or_,
-                           toremove)
+                    Q(*toremove, _connector=Q.OR)
                 ).delete(removed_ranges=ranges, deleted_counter=deleted_counter)
         return deleted_counter
 
@@ -511,34 +509,42 @@ class NS_Node(Node):
 
         # tree, iterative preorder
         added = []
-        if parent:
-            parent_id = parent.pk
-        else:
-            parent_id = None
         # stack of nodes to analyze
-        stack = [(parent_id, node) for node in bulk_data[::-1]]
+        stack = [(parent, node) for node in reversed(bulk_data)]
         foreign_keys = cls.get_foreign_keys()
         pk_field = cls._meta.pk.attname
-        while stack:
-            parent_id, node_struct = stack.pop()
-            # shallow copy of the data structure so it doesn't persist...
-            node_data = node_struct['data'].copy()
-            cls._process_foreign_keys(foreign_keys, node_data)
-            if keep_ids:
-                node_data[pk_field] = node_struct[pk_field]
-            if parent_id:
-                parent = cls.objects.get(pk=parent_id)
-                node_obj = parent.add_child(**node_data)
-            else:
-                node_obj = cls.add_root(**node_data)
-            added.append(node_obj.pk)
-            if 'children' in node_struct:
-                # extending the stack with the current node as the parent of
-                # the new nodes
-                stack.extend([
-                    (node_obj.pk, node)
-                    for node in node_struct['children'][::-1]
-                ])
+
+        # the loop runs once per node, avoid repeated attribute lookups
+        pop, extend = stack.pop, stack.extend
+        with transaction.atomic(
+                using=cls._get_database_connection('write').alias,
+                savepoint=False):
+            while stack:
+                parent, node_struct = pop()
+                node_data = node_struct['data']
+                if foreign_keys or keep_ids:
+                    # shallow copy of the data so the changes don't persist
+                    node_data = node_data.copy()
+                    if foreign_keys:
+                        cls._process_foreign_keys(foreign_keys, node_data)
+                    if keep_ids:
+                        node_data[pk_field] = node_struct[pk_field]
+                if parent:
+                    # the nodes added since the parent was loaded moved the
+                    # bounds of its branch, and add_child() finds the last
+                    # child with them, so only those are read again
+                    parent.refresh_from_db(fields=['lft', 'rgt'])
+                    node_obj = parent.add_child(**node_data)
+                else:
+                    node_obj = cls.add_root(**node_data)
+                added.append(node_obj.pk)
+                if 'children' in node_struct:
+                    # extending the stack with the current node as the parent
+                    # of the new nodes
+                    extend(
+                        (node_obj, node)
+                        for node in reversed(node_struct['children'])
+                    )
         return added
 
     def get_children(self):
@@ -573,13 +579,40 @@ class NS_Node(Node):
             return self.get_root_nodes()
         return self.get_parent(True).get_children()
 
+    def get_next_sibling(self):
+        """
+        :returns: The next node's sibling, or None if it was the rightmost
+            sibling.
+        """
+        if self.lft == 1:
+            return self.get_root_nodes().filter(
+                tree_id__gt=self.tree_id).first()
+        # the next sibling starts right after the node's branch ends
+        return get_result_class(self.__class__).objects.filter(
+            tree_id=self.tree_id, lft=self.rgt + 1).first()
+
+    def get_prev_sibling(self):
+        """
+        :returns: The previous node's sibling, or None if it was the leftmost
+            sibling.
+        """
+        if self.lft == 1:
+            return self.get_root_nodes().filter(
+                tree_id__lt=self.tree_id).last()
+        # the branch of the previous sibling ends right before the node
+        return get_result_class(self.__class__).objects.filter(
+            tree_id=self.tree_id, rgt=self.lft - 1).first()
+
     @classmethod
     def dump_bulk(cls, parent=None, keep_ids=True):
         """Dumps a tree branch to a python data structure."""
         qset = cls._get_serializable_model().get_tree(parent)
-        ret, lnk = [], {}
+        ret = []
+        # branches of the dumped nodes that may still contain the next
+        # nodes, as (tree_id, rgt, serialized node) tuples
+        branches = []
         pk_field = cls._meta.pk.attname
-        for pyobj in qset:
+        for pyobj in qset.iterator():
             serobj = serializers.serialize('python', [pyobj])[0]
             # django's serializer stores the attributes in 'fields'
             fields = serobj['fields']
@@ -597,16 +630,20 @@ class NS_Node(Node):
             if keep_ids:
                 newobj[pk_field] = serobj['pk']
 
+            # the nodes are sorted as DFS, so the parent of a node is the
+            # innermost dumped node whose branch still contains it
+            while branches and (branches[-1][0] != pyobj.tree_id or
+                                branches[-1][1] < pyobj.lft):
+                branches.pop()
             if (not parent and depth == 1) or\
                (parent and depth == parent.depth):
                 ret.append(newobj)
             else:
-                parentobj = pyobj.get_parent()
-                parentser = lnk[parentobj.pk]
+                parentser = branches[-1][2]
                 if 'children' not in parentser:
                     parentser['children'] = []
                 parentser['children'].append(newobj)
-            lnk[pyobj.pk] = newobj
+            branches.append((pyobj.tree_id, pyobj.rgt, newobj))
         return ret
 
     @classmethod
@@ -664,6 +701,27 @@ class NS_Node(Node):
             self.rgt < node.rgt
         )
 
+    def is_child_of(self, node):
+        """
+        :returns: ``True`` if the node is a child of another node given as an
+            argument, else, returns ``False``
+        """
+        return self.depth == node.depth + 1 and self.is_descendant_of(node)
+
+    def is_sibling_of(self, node):
+        """
+        :returns: ``True`` if the node is a sibling of another node given as an
+            argument, else, returns ``False``
+        """
+        if self.depth != node.depth:
+            return False
+        if self.lft == 1:
+            # all the root nodes are siblings
+            return True
+        if self.tree_id != node.tree_id:
+            return False
+        return super().is_sibling_of(node)
+
     def get_parent(self, update=False):
         """
         :returns: the parent node of the current node object.
@@ -682,6 +740,36 @@ class NS_Node(Node):
         self._cached_parent_obj = self.get_ancestors().reverse()[0]
         return self._cached_parent_obj
 
+    @classmethod
+    def _prefetch_parents(cls, nodes):
+        """
+        Caches the parents of many nodes, finding them in as few queries as
+        the database allows.
+        """
+        nodes = [node for node in nodes if node.lft != 1]
+        if not nodes:
+            return
+        # parent = the ancestor one level above the node
+        candidates = {}
+        queryset = get_result_class(cls).objects
+        batch_size = cls._get_database_connection(
+            'read').ops.bulk_batch_size(['tree_id', 'depth', 'lft', 'rgt'],
+                                        nodes)
+        for start in range(0, len(nodes), batch_size):
+            conds = [
+                Q(tree_id=node.tree_id, depth=node.depth - 1,
+                  lft__lt=node.lft, rgt__gt=node.rgt)
+                for node in nodes[start:start + batch_size]
+            ]
+            for parent in queryset.filter(Q(*conds, _connector=Q.OR)):
+                candidates.setdefault(
+                    (parent.tree_id, parent.depth), []).append(parent)
+        for node in nodes:
+            for parent in candidates.get((node.tree_id, node.depth - 1), []):
+                if parent.lft < node.lft and parent.rgt > node.rgt:
+                    node._cached_parent_obj = parent
+                    break
+
     @classmethod
     def get_root_nodes(cls):
         """:returns: A queryset containing the root nodes in the tree."""
@@ -52,6 +52,17 @@ class NumConv(object):
         if len(self.cached_map) != len(self.alphabet):
             raise ValueError("duplicate characters found in '%s'" % (
                 self.alphabet, ))
+        # values of the digits that are valid for the radix
+        self.radix_map = dict(zip(self.alphabet[:radix], range(radix)))
+        # the alphabet and radix never change, so decide once if the
+        # built-in python conversions can be used
+        self.builtin_int2str = None
+        if radix in (8, 10, 16) and \
+                alphabet[:radix].lower() == BASE85[:radix].lower():
+            self.builtin_int2str = {8: '%o', 10: '%d', 16: '%X'}[radix]
+        self.builtin_str2int = (
+            radix <= 36 and
+            alphabet[:radix].lower() == BASE85[:radix].lower())
 
     def int2str(self, num):
         """Converts an integer into a string.
@@ -68,16 +79,15 @@ class NumConv(object):
             raise TypeError('number must be an integer')
         if num < 0:
             raise ValueError('number must be positive')
+        if self.builtin_int2str:
+            return self.builtin_int2str % num
         radix, alphabet = self.radix, self.alphabet
-        if radix in (8, 10, 16) and \
-                alphabet[:radix].lower() == BASE85[:radix].lower():
-            return ({8: '%o', 10: '%d', 16: '%x'}[radix] % num).upper()
         ret = ''
         while True:
-            ret = alphabet[num % radix] + ret
-            if num < radix:
+            num, rem = divmod(num, radix)
+            ret = alphabet[rem] + ret
+            if not num:
                 break
-            num //= radix
         return ret
 
     def str2int(self, num):
@@ -92,16 +102,16 @@ class NumConv(object):
 
         :raise ValueError: when *num* is invalid
         """
-        radix, alphabet = self.radix, self.alphabet
-        if radix <= 36 and alphabet[:radix].lower() == BASE85[:radix].lower():
-            return int(num, radix)
+        if self.builtin_str2int:
+            return int(num, self.radix)
+        radix, radix_map = self.radix, self.radix_map
         ret = 0
-        lalphabet = alphabet[:radix]
         for char in num:
-            if char not in lalphabet:
+            try:
+                ret = ret * radix + radix_map[char]
+            except KeyError:
                 raise ValueError("invalid literal for radix2int() with radix "
                                  "%d: '%s'" % (radix, num))
-            ret = ret * radix + self.cached_map[char]
         return ret
 
 
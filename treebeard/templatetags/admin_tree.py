@@ -162,6 +162,8 @@ def get_parent_id(node):
 
 
 def results(cl):
+    # the parent of every row is needed, get all of them at once
+    cl.model._prefetch_parents(cl.result_list)
     if cl.formset:
         for res, form in zip(cl.result_list, cl.formset.forms):
             yield (res.pk, get_parent_id(res), res.get_depth(),
@@ -7,6 +7,7 @@ from django.contrib.admin.sites import AdminSite
 from django.contrib.admin.views.main import ChangeList
 from django.contrib.auth.models import User, AnonymousUser
 from django.contrib.messages.storage.fallback import FallbackStorage
+from django.db import connection
 from django.db.models import Q
 from django.db.models.signals import post_save
 from django.dispatch import receiver
@@ -21,6 +22,7 @@ import pytest
 
 from treebeard import numconv
 from treebeard.admin import admin_factory
+from treebeard.al_tree import AL_Node
 from treebeard.exceptions import (
     InvalidPosition,
     InvalidMoveToDescendant,
@@ -29,6 +31,7 @@ from treebeard.exceptions import (
     NodeAlreadySaved,
 )
 from treebeard.forms import movenodeform_factory
+from treebeard.mp_tree import MP_Node
 from treebeard.tests import models
 from treebeard.tests.admin import register_all as admin_register_all
 
@@ -448,6 +451,11 @@ class TestSimpleNodeMethods(TestNonEmptyTree):
             got = model.objects.get(desc=desc).is_root()
             assert got == expected
 
+    def test_is_root_no_of_queries(self, model, django_assert_num_queries):
+        nodes = [model.objects.get(desc=desc) for desc in ["2", "231"]]
+        with django_assert_num_queries(0):
+            assert [node.is_root() for node in nodes] == [True, False]
+
     def test_is_leaf(self, model):
         data = [
             ("2", False),
@@ -508,6 +516,44 @@ class TestSimpleNodeMethods(TestNonEmptyTree):
             else:
                 assert parent is None
 
+    def test_prefetch_parents(self, model, django_assert_num_queries):
+        nodes = list(model.objects.all())
+        model._prefetch_parents(nodes)
+        if model._meta.proxy and issubclass(model, AL_Node):
+            # proxy AL nodes always fetch their parents
+            expected_queries = len([node for node in nodes if node.parent_id])
+        else:
+            expected_queries = 0
+        with django_assert_num_queries(expected_queries):
+            parents = [node.get_parent() for node in nodes]
+        got = [
+            (node.desc, parent and parent.desc)
+            for node, parent in zip(nodes, parents)
+        ]
+        assert sorted(got) == [
+            ("1", None), ("2", None), ("21", "2"), ("22", "2"), ("23", "2"),
+            ("231", "23"), ("24", "2"), ("3", None), ("4", None), ("41", "4"),
+        ]
+
+    def test_prefetch_parents_in_batches(self, monkeypatch, django_assert_num_queries):
+        model = models.NS_TestNode
+        model.load_bulk(BASE_DATA)
+        nodes = list(model.objects.all())
+        monkeypatch.setattr(
+            type(connection.ops), "bulk_batch_size", lambda self, fields, objs: 4
+        )
+        # 6 nodes with a parent, looked up 4 at a time
+        with django_assert_num_queries(2):
+            model._prefetch_parents(nodes)
+        with django_assert_num_queries(0):
+            got = [(node.desc, node.get_parent()) for node in nodes]
+        assert sorted(
+            (desc, parent and parent.desc) for desc, parent in got
+        ) == [
+            ("1", None), ("2", None), ("21", "2"), ("22", "2"), ("23", "2"),
+            ("231", "23"), ("24", "2"), ("3", None), ("4", None), ("41", "4"),
+        ]
+
     def test_get_children(self, model):
         data = [
             ("2", ["21", "22", "23", "24"]),
@@ -591,6 +637,14 @@ class TestSimpleNodeMethods(TestNonEmptyTree):
                 assert node.desc == expected
                 assert type(node) == model
 
+    def test_get_prev_next_sibling_no_of_queries(self, model, django_assert_num_queries):
+        for desc in ["2", "22"]:
+            node = model.objects.get(desc=desc)
+            with django_assert_num_queries(1):
+                node.get_prev_sibling()
+            with django_assert_num_queries(1):
+                node.get_next_sibling()
+
     def test_get_last_sibling(self, model):
         data = [
             ("2", "4"),
@@ -715,6 +769,16 @@ class TestSimpleNodeMethods(TestNonEmptyTree):
             node2 = model.objects.get(desc=desc2)
             assert node1.is_descendant_of(node2) == expected
 
+    def test_is_child_or_sibling_of_no_of_queries(self, model, django_assert_num_queries):
+        node1 = model.objects.get(desc="1")
+        node2 = model.objects.get(desc="2")
+        node21 = model.objects.get(desc="21")
+        with django_assert_num_queries(0):
+            assert node21.is_child_of(node2)
+            assert not node21.is_child_of(node1)
+            assert node1.is_sibling_of(node2)
+            assert not node21.is_sibling_of(node2)
+
 
 @pytest.mark.django_db
 class TestAddChild(TestNonEmptyTree):
@@ -1109,6 +1173,45 @@ class TestDelete(TestTreeBase):
         assert self.got(delete_model) == expected
         assert result == (12, {delete_model._meta.label: 6, dep_model._meta.label: 6})
 
+    def test_delete_filter_siblings(self, delete_dep_model_pair):
+        delete_model, dep_model = delete_dep_model_pair
+        result = delete_model.objects.filter(desc__in=("231", "23", "24", "41")).delete()
+        expected = [
+            ("1", 1, 0),
+            ("2", 1, 2),
+            ("21", 2, 0),
+            ("22", 2, 0),
+            ("3", 1, 0),
+            ("4", 1, 0),
+        ]
+        assert self.got(delete_model) == expected
+        assert result == (8, {delete_model._meta.label: 4, dep_model._meta.label: 4})
+
+    def test_delete_keeps_wrong_numchild_positive(self):
+        model = models.MP_TestNode
+        model.load_bulk(BASE_DATA)
+        model.objects.filter(desc="2").update(numchild=1)
+        model.objects.filter(desc__in=("21", "22")).delete()
+        assert model.objects.get(desc="2").numchild == 0
+
+    def test_delete_updates_parents_in_batches(self, monkeypatch):
+        model = models.MP_TestNode
+        model.load_bulk(BASE_DATA)
+        for desc in ("1", "3"):
+            node = model.objects.get(desc=desc)
+            node.add_child(desc=desc + "1")
+            node.add_child(desc=desc + "2")
+        monkeypatch.setattr(
+            type(connection.ops), "bulk_batch_size", lambda self, fields, objs: 1
+        )
+        # every parent is updated on its own: 2 parents lose 2 children and
+        # 2 parents lose 1
+        model.objects.filter(
+            desc__in=("11", "12", "22", "24", "31", "41")).delete()
+        assert [
+            (o.desc, o.numchild) for o in model.get_root_nodes()
+        ] == [("1", 0), ("2", 2), ("3", 1), ("4", 0)]
+
     def test_delete_nonexistant_nodes(self, delete_dep_model_pair):
         delete_model, dep_model = delete_dep_model_pair
         result = delete_model.objects.filter(desc__in=("ZZZ", "XXX")).delete()
@@ -1691,6 +1794,21 @@ class TestTreeSorted(TestTreeBase):
         ]
         assert self.got(sorted_model) == expected
 
+    def test_get_prev_next_sibling_sorted(self, sorted_model):
+        sorted_model.add_root(val1=3, val2=3, desc="zxy")
+        bcd = sorted_model.add_root(val1=1, val2=4, desc="bcd")
+        qwe = sorted_model.add_root(val1=2, val2=2, desc="qwe")
+        fgh = sorted_model.add_root(val1=4, val2=1, desc="fgh")
+        bcd, qwe, fgh = [
+            sorted_model.objects.get(pk=node.pk) for node in (bcd, qwe, fgh)
+        ]
+        assert bcd.get_prev_sibling() is None
+        assert bcd.get_next_sibling().desc == "qwe"
+        assert qwe.get_prev_sibling().desc == "bcd"
+        assert qwe.get_next_sibling().desc == "zxy"
+        assert fgh.get_prev_sibling().desc == "zxy"
+        assert fgh.get_next_sibling() is None
+
     def test_add_child_root_sorted(self, sorted_model):
         root = sorted_model.add_root(val1=0, val2=0, desc="aaa")
         root.add_child(val1=3, val2=3, desc="zxy")
@@ -2015,6 +2133,59 @@ class TestMP_TreeAlphabet(TestTreeBase):
             last_good, len(last_good)
         )
 
+    @pytest.mark.django_db
+    def test_changed_alphabet(self, monkeypatch):
+        model = models.MP_TestNodeAlphabet
+        # all the digits sort after the ones of the default alphabet
+        monkeypatch.setattr(model, "alphabet", "abcdefghij")
+        root = model.add_root(numval=0)
+        root.add_child(numval=1)
+        root.add_child(numval=2)
+        root = model.objects.get(pk=root.pk)
+        assert root.path == "ab"
+        assert [(o.path, o.numval) for o in root.get_children()] == [
+            ("abab", 1),
+            ("abac", 2),
+        ]
+        assert [o.numval for o in root.get_children()[0].get_siblings()] == [1, 2]
+
+
+class TestMP_TreeSettingsValidation:
+    @staticmethod
+    def make_model(**attrs):
+        attrs.update(
+            __module__=__name__,
+            Meta=type("Meta", (), {"abstract": True, "app_label": "tests"}),
+        )
+        return type("MP_TestNodeSettings", (MP_Node,), attrs)
+
+    def test_valid_settings(self):
+        model = self.make_model(steplen=2, alphabet="0123456789")
+        assert model._get_path(None, 1, 12) == "12"
+
+    @pytest.mark.parametrize(
+        "path, expected",
+        [("0001", "0002"), ("0009", "0010"), ("0189", "0190"), ("01", "02")],
+    )
+    def test_next_path(self, path, expected):
+        model = self.make_model(steplen=2, alphabet="0123456789")
+        assert model._get_next_path(path) == expected
+
+    def test_next_path_overflow(self):
+        model = self.make_model(steplen=2, alphabet="0123456789")
+        with pytest.raises(PathOverflow):
+            model._get_next_path("0199")
+
+    @pytest.mark.parametrize("alphabet", ["0", "01234567890"])
+    def test_invalid_alphabet(self, alphabet):
+        with pytest.raises(ValueError):
+            self.make_model(alphabet=alphabet)
+
+    @pytest.mark.parametrize("steplen", [0, 1.5])
+    def test_invalid_steplen(self, steplen):
+        with pytest.raises(ValueError):
+            self.make_model(steplen=steplen)
+
 
 @pytest.mark.django_db
 class TestHelpers(TestTreeBase):
@@ -2047,6 +2218,17 @@ class TestHelpers(TestTreeBase):
         ]
         assert got == expected
 
+    def test_al_descendants_group_count_no_of_queries(self, django_assert_num_queries):
+        model = models.AL_TestNode
+        model.load_bulk(BASE_DATA)
+        # the root nodes and one query per level of descendants
+        with django_assert_num_queries(4):
+            got = [
+                (o.desc, o.descendants_count)
+                for o in model.get_descendants_group_count()
+            ]
+        assert got == [("1", 0), ("2", 5), ("3", 0), ("4", 1)]
+
 
 @pytest.mark.django_db
 class TestMP_TreeSortedAutoNow(TestTreeBase):
@@ -3102,6 +3284,167 @@ class TestMP_TreeDescendantsPerformance(TestTreeBase):
                 list(node.get_descendants())
 
 
+@pytest.mark.django_db
+class TestMP_TreeLoadBulkPerformance(TestTreeBase):
+    def test_load_bulk_no_of_queries(self, django_assert_num_queries):
+        model = models.MP_TestNode
+        # last root lookup and a single bulk INSERT
+        with django_assert_num_queries(2):
+            model.load_bulk(BASE_DATA)
+        assert self.got(model) == UNCHANGED
+
+    def test_load_bulk_without_returned_pks(self, django_assert_num_queries, monkeypatch):
+        model = models.MP_TestNode
+        monkeypatch.setattr(
+            type(connection.features), "can_return_rows_from_bulk_insert", False
+        )
+        # last root lookup, a single bulk INSERT and the primary keys lookup
+        with django_assert_num_queries(3):
+            ids = model.load_bulk(BASE_DATA)
+        assert self.got(model) == UNCHANGED
+        assert ids == [
+            model.objects.get(desc=desc).pk
+            for desc in ["1", "2", "21", "22", "23", "231", "24", "3", "4", "41"]
+        ]
+
+    def test_load_bulk_in_parent_no_of_queries(self, django_assert_num_queries):
+        model = models.MP_TestNode
+        model.load_bulk(BASE_DATA)
+        parent = model.objects.get(desc="23")
+        # last child lookup, bulk INSERT and the parent's numchild UPDATE
+        with django_assert_num_queries(3):
+            model.load_bulk(BASE_DATA, parent=parent)
+        assert parent.numchild == 5
+        assert [
+            (o.path, o.depth, o.numchild)
+            for o in model.get_tree(parent)
+        ] == [
+            ("002003", 2, 5),
+            ("002003001", 3, 0),
+            ("002003002", 3, 0),
+            ("002003003", 3, 4),
+            ("002003003001", 4, 0),
+            ("002003003002", 4, 0),
+            ("002003003003", 4, 1),
+            ("002003003003001", 5, 0),
+            ("002003003004", 4, 0),
+            ("002003004", 3, 0),
+            ("002003005", 3, 1),
+            ("002003005001", 4, 0),
+        ]
+
+    def test_load_bulk_with_post_save(self, django_assert_num_queries):
+        model = models.MP_TestNode
+        saved = []
+
+        @receiver(post_save, sender=model, dispatch_uid="test_load_bulk_post_save")
+        def on_post_save(instance, **kwargs):
+            saved.append(instance.desc)
+
+        try:
+            # nodes are saved one by one when something relies on save()
+            # last root lookup, one INSERT per node and one numchild UPDATE
+            # per distinct number of added children (4 for "2", 1 for "23"
+            # and "4")
+            with django_assert_num_queries(1 + 10 + 2):
+                model.load_bulk(BASE_DATA)
+        finally:
+            post_save.disconnect(sender=model, dispatch_uid="test_load_bulk_post_save")
+        assert saved == ["1", "2", "21", "22", "23", "231", "24", "3", "4", "41"]
+        assert self.got(model) == UNCHANGED
+
+
+@pytest.mark.django_db
+class TestNS_TreeDumpBulkPerformance(TestTreeBase):
+    def test_dump_bulk_no_of_queries(self, django_assert_num_queries):
+        model = models.NS_TestNode
+        model.load_bulk(BASE_DATA)
+        with django_assert_num_queries(1):
+            assert model.dump_bulk(keep_ids=False) == BASE_DATA
+
+    def test_dump_bulk_node_no_of_queries(self, django_assert_num_queries):
+        model = models.NS_TestNode
+        model.load_bulk(BASE_DATA)
+        node = model.objects.get(desc="2")
+        with django_assert_num_queries(1):
+            got = model.dump_bulk(node, False)
+        assert got == [BASE_DATA[1]]
+
+
+@pytest.mark.django_db
+class TestMP_TreeAddSiblingPerformance(TestTreeBase):
+    def test_add_first_sibling_no_of_queries(self, django_assert_num_queries):
+        model = models.MP_TestNode
+        model.load_bulk(BASE_DATA)
+        node = model.objects.get(desc="22")
+        # siblings lookup, one batch shifting the 4 siblings to the right,
+        # parent's numchild update, and the INSERT
+        with django_assert_num_queries(4):
+            node.add_sibling("first-sibling", desc="20")
+        expected = [
+            ("1", 1, 0),
+            ("2", 1, 5),
+            ("20", 2, 0),
+            ("21", 2, 0),
+            ("22", 2, 0),
+            ("23", 2, 1),
+            ("231", 3, 0),
+            ("24", 2, 0),
+            ("3", 1, 0),
+            ("4", 1, 1),
+            ("41", 2, 0),
+        ]
+        assert self.got(model) == expected
+
+
+@pytest.mark.django_db
+class TestMP_TreeMovePerformance(TestTreeBase):
+    def test_move_right_of_last_sibling_no_of_queries(self, django_assert_num_queries):
+        model = models.MP_TestNode
+        model.load_bulk(BASE_DATA)
+        node = model.objects.get(desc="21")
+        target = model.objects.get(desc="24")
+        # the last sibling's path is fetched once, then the branch UPDATE
+        with django_assert_num_queries(2):
+            node.move(target, "right")
+        expected = [
+            ("1", 1, 0),
+            ("2", 1, 4),
+            ("22", 2, 0),
+            ("23", 2, 1),
+            ("231", 3, 0),
+            ("24", 2, 0),
+            ("21", 2, 0),
+            ("3", 1, 0),
+            ("4", 1, 1),
+            ("41", 2, 0),
+        ]
+        assert self.got(model) == expected
+
+    def test_move_to_another_parent_no_of_queries(self, django_assert_num_queries):
+        model = models.MP_TestNode
+        model.load_bulk(BASE_DATA)
+        node = model.objects.get(desc="21")
+        target = model.objects.get(desc="41")
+        # the branch UPDATE and a single UPDATE for the numchild of both
+        # parents
+        with django_assert_num_queries(2):
+            node.move(target, "last-child")
+        expected = [
+            ("1", 1, 0),
+            ("2", 1, 3),
+            ("22", 2, 0),
+            ("23", 2, 1),
+            ("231", 3, 0),
+            ("24", 2, 0),
+            ("3", 1, 0),
+            ("4", 1, 1),
+            ("41", 2, 1),
+            ("21", 3, 0),
+        ]
+        assert self.got(model) == expected
+
+
 @pytest.mark.django_db
 class TestRegression:
     def test_dump_bulk_regression_issue_219(self):